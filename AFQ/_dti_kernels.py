@@ -0,0 +1,119 @@
+import numpy as np
+
+from dipy.reconst import dti
+
+try:
+    from numba import njit, prange
+    has_numba = True
+except ModuleNotFoundError:
+    has_numba = False
+
+
+if has_numba:
+    @njit(parallel=True, cache=True)
+    def _dti_metrics_kernel(evals, fa, md, ad, rd):
+        for i in prange(evals.shape[0]):
+            for j in range(evals.shape[1]):
+                for k in range(evals.shape[2]):
+                    l1 = evals[i, j, k, 0]
+                    l2 = evals[i, j, k, 1]
+                    l3 = evals[i, j, k, 2]
+                    md[i, j, k] = (l1 + l2 + l3) / 3.
+                    ad[i, j, k] = l1
+                    rd[i, j, k] = (l2 + l3) / 2.
+                    norm = l1 * l1 + l2 * l2 + l3 * l3
+                    if norm == 0:
+                        fa[i, j, k] = 0.
+                    else:
+                        fa[i, j, k] = np.sqrt(0.5 * (
+                            (l1 - l2) ** 2 + (l2 - l3) ** 2
+                            + (l3 - l1) ** 2) / norm)
+
+    @njit(parallel=True, cache=True)
+    def _seed_roi_kernel(rois, fa, fa_thresh, seed_roi):
+        for i in prange(fa.shape[0]):
+            for j in range(fa.shape[1]):
+                for k in range(fa.shape[2]):
+                    seed_roi[i, j, k] = False
+                    if fa[i, j, k] < fa_thresh:
+                        continue
+                    for n in range(rois.shape[0]):
+                        if rois[n, i, j, k]:
+                            seed_roi[i, j, k] = True
+                            break
+
+
+def dti_metrics(evals):
+    """
+    Calculate FA, MD, AD and RD from DTI eigenvalues.
+
+    If numba is installed, all four maps are computed in a single fused pass
+    over the voxels. Otherwise, falls back to numpy.
+
+    Parameters
+    ----------
+    evals : 4D array
+        Eigenvalues of the diffusion tensor in each voxel, sorted in
+        descending order along the last axis.
+
+    Returns
+    -------
+    FA, MD, AD, RD : 3D arrays
+    """
+    if not has_numba:
+        return (dti.fractional_anisotropy(evals), evals.mean(-1),
+                evals[..., 0], evals[..., 1:].mean(-1))
+
+    fa, md, ad, rd = np.empty((4,) + evals.shape[:-1], dtype=evals.dtype)
+    _dti_metrics_kernel(evals, fa, md, ad, rd)
+    return fa, md, ad, rd
+
+
+def make_seed_roi(rois, fa, fa_thresh):
+    """
+    Combine ROIs into a single mask, keeping only voxels above an FA
+    threshold.
+
+    If numba is installed, the ROIs are or'd together and thresholded in a
+    single pass over the voxels, which skips the ROIs of voxels below the
+    threshold. Otherwise, falls back to numpy.
+
+    Parameters
+    ----------
+    rois : 4D array
+        Boolean ROIs, stacked along the first axis.
+    fa : 3D array
+        FA in each voxel.
+    fa_thresh : float
+        Voxels with an FA smaller than this are excluded.
+
+    Returns
+    -------
+    3D boolean array
+    """
+    if not has_numba:
+        return np.logical_and(np.any(rois, axis=0), fa >= fa_thresh)
+
+    seed_roi = np.empty(fa.shape, dtype=bool)
+    _seed_roi_kernel(rois, fa, fa_thresh, seed_roi)
+    return seed_roi
+
+
+def warmup():
+    """
+    Compile the numba kernels for the argument types that they are commonly
+    called with, so that compilation, or loading from numba's on-disk cache,
+    does not happen in the middle of a fit. This is optional: each kernel is
+    otherwise compiled the first time it is called with a new type.
+    """
+    if not has_numba:
+        return
+    for dtype in [np.float64, np.float32]:
+        # fit_dti passes a strided view of the model parameters:
+        dti_metrics(np.zeros((1, 1, 1, 12), dtype=dtype)[..., :3])
+        dti_metrics(np.zeros((1, 1, 1, 3), dtype=dtype))
+        for fa_thresh in [0., 0]:
+            make_seed_roi(
+                np.zeros((1, 1, 1, 1), dtype=bool),
+                np.zeros((1, 1, 1), dtype=dtype),
+                fa_thresh)
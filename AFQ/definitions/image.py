@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
 import nibabel as nib
@@ -5,6 +7,7 @@ from dipy.segment.mask import median_otsu
 
 from dipy.align import resample
 import AFQ.utils.volume as auv
+from AFQ._dti_kernels import make_seed_roi
 from AFQ.definitions.utils import Definition, find_file, name_from_path
 
 
@@ -222,6 +225,10 @@ class RoiImage(ImageDefinition):
     use_endpoints : bool
         Whether to use the endpoints ("start" and "end") instead of the
         include ROIs to generate the image.
+    fa_threshold : float, optional
+        If not None, only voxels where the DTI FA is at least this value
+        are kept in the image.
+        Default: None
 
     Examples
     --------
@@ -232,10 +239,12 @@ class RoiImage(ImageDefinition):
     def __init__(self,
                  use_waypoints=True,
                  use_presegment=False,
-                 use_endpoints=False):
+                 use_endpoints=False,
+                 fa_threshold=None):
         self.use_waypoints = use_waypoints
         self.use_presegment = use_presegment
         self.use_endpoints = use_endpoints
+        self.fa_threshold = fa_threshold
         if not np.logical_or(self.use_waypoints, np.logical_or(
                 self.use_endpoints, self.use_presegment)):
             raise ValueError((
@@ -251,7 +260,6 @@ class RoiImage(ImageDefinition):
     def get_image_getter(self, task_name):
         def _image_getter_helper(dwi_affine, mapping,
                                  data_imap, segmentation_params):
-            image_data = None
             bundle_dict = data_imap["bundle_dict"]
             if self.use_presegment:
                 bundle_dict = \
@@ -259,6 +267,19 @@ class RoiImage(ImageDefinition):
             else:
                 bundle_dict = bundle_dict
 
+            def _warp_roi(roi, bundle_name, bundle_info):
+                if "space" not in bundle_info\
+                    or bundle_info[
+                        "space"] == "template":
+                    warped_roi = auv.transform_inverse_roi(
+                        roi,
+                        mapping,
+                        bundle_name=bundle_name)
+                else:
+                    warped_roi = roi.get_fdata()
+                return warped_roi.astype(bool)
+
+            roi_args = []
             for bundle_name, bundle_info in bundle_dict.items():
                 rois = []
                 if self.use_endpoints:
@@ -268,22 +289,27 @@ class RoiImage(ImageDefinition):
                 if self.use_waypoints:
                     rois.extend(bundle_info['include']
                                 if 'include' in bundle_info else [])
-                for roi in rois:
-                    if "space" not in bundle_info\
-                        or bundle_info[
-                            "space"] == "template":
-                        warped_roi = auv.transform_inverse_roi(
-                            roi,
-                            mapping,
-                            bundle_name=bundle_name)
-                    else:
-                        warped_roi = roi.get_fdata()
-
-                    if image_data is None:
-                        image_data = np.zeros(warped_roi.shape)
-                    image_data = np.logical_or(
-                        image_data,
-                        warped_roi.astype(bool))
+                roi_args.extend(
+                    (roi, bundle_name, bundle_info) for roi in rois)
+
+            if len(roi_args) == 0:
+                raise ValueError((
+                    "RoiImage found no ROIs to use in the bundle dict. "
+                    "Check that the bundles have the ROIs requested by "
+                    "use_waypoints, use_endpoints and use_presegment."))
+
+            # ROIs are warped independently of each other, and most of the
+            # interpolation happens outside of the GIL, so they are warped
+            # concurrently and then or'd together in a single pass:
+            with ThreadPoolExecutor() as executor:
+                warped_rois = list(executor.map(_warp_roi, *zip(*roi_args)))
+            if self.fa_threshold is None:
+                image_data = np.any(warped_rois, axis=0)
+            else:
+                image_data = make_seed_roi(
+                    np.asarray(warped_rois),
+                    nib.load(data_imap["dti_fa"]).get_fdata(),
+                    self.fa_threshold)
             return nib.Nifti1Image(
                 image_data.astype(np.float32),
                 dwi_affine), dict(source="ROIs")
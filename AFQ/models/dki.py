@@ -340,15 +340,10 @@ def predict(params_file, gtab, S0_file=None, out_dir=None):
     if S0_file is None:
         S0 = 100
     else:
-        S0 = nib.load(S0_file).get_fdata()
-        # If the S0 data is 4D, we assume it comes from an acquisition that had
-        # B0 measurements in the same volumes described in the gtab:
-        if len(S0.shape) == 4:
-            S0 = np.mean(S0[..., gtab.b0s_mask], -1)
-        # Otherwise, we assume that it's already a 3D volume, and do nothing
+        S0 = ut.read_S0(S0_file, gtab)
 
     img = nib.load(params_file)
-    params = img.get_fdata()
+    params = np.asanyarray(img.dataobj)
     pred = dki.dki_prediction(params, gtab, S0=S0)
     fname = op.join(out_dir, 'dki_prediction.nii.gz')
     nib.save(nib.Nifti1Image(pred, img.affine), fname)
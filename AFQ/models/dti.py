@@ -1,13 +1,21 @@
 import os
 import os.path as op
+import hashlib
+import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import nibabel as nib
 
+from dipy import __version__ as dipy_version
 from dipy.reconst import dti
+from dipy.utils.parallel import paramap
 from scipy.special import gamma
 
 import AFQ.utils.models as ut
+from AFQ.version import version as pyafq_version
+from AFQ._dti_kernels import dti_metrics
 
 __all__ = ["fit_dti", "predict"]
 
@@ -82,8 +90,74 @@ def _fit(gtab, data, mask=None, sigma=None):
     return dtimodel.fit(data, mask=mask)
 
 
+def _fit_slab(slab, data_file, gtab):
+    start, stop, mask = slab
+    data = np.load(data_file, mmap_mode='r')[start:stop]
+    if mask is not None and not np.any(mask):
+        return np.zeros(data.shape[:-1] + (12,))
+    return _fit(gtab, data, mask=mask).model_params
+
+
+def _fit_parallel(gtab, data, mask=None, n_jobs=-1, engine="joblib",
+                  backend="loky"):
+    """
+    Fit the DTI model in slabs along the first spatial axis, with each slab
+    fit in a separate process, and return the stitched model parameters.
+
+    The data is saved once to a temporary .npy file, which every worker
+    memory-maps, instead of pickling a copy of the data for each worker.
+    """
+    n_slabs = n_jobs if n_jobs > 0 else os.cpu_count()
+    n_slabs = min(n_slabs, data.shape[0])
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+    slabs = []
+    for idx in np.array_split(np.arange(data.shape[0]), n_slabs):
+        start, stop = idx[0], idx[-1] + 1
+        slabs.append(
+            (start, stop, None if mask is None else mask[start:stop]))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        data_file = op.join(tmpdir, 'data.npy')
+        np.save(data_file, data)
+        params = paramap(
+            _fit_slab, slabs,
+            func_args=[data_file, gtab], n_jobs=n_jobs, engine=engine,
+            backend=backend)
+    return np.concatenate(params)
+
+
+def _inputs_key(data_files, bval_files, bvec_files, mask=None,
+                b0_threshold=50):
+    """
+    A hash of the inputs to `fit_dti`, based on the path, modification time
+    and size of the input files, and on the versions of pyAFQ and DIPY, used
+    to tell whether saved maps are stale.
+    """
+    fnames = []
+    for files in [data_files, bval_files, bvec_files, mask]:
+        if isinstance(files, (str, os.PathLike)):
+            fnames.append(os.fspath(files))
+        elif isinstance(files, list):
+            fnames.extend(os.fspath(fname) for fname in files)
+
+    hasher = hashlib.sha1()
+    hasher.update(repr((pyafq_version, dipy_version)).encode())
+    for fname in fnames:
+        stat = os.stat(fname)
+        hasher.update(repr(
+            (op.abspath(fname), stat.st_mtime_ns, stat.st_size)).encode())
+    if mask is not None and not isinstance(mask, (str, os.PathLike)):
+        mask = np.ascontiguousarray(mask)
+        hasher.update(repr(mask.shape).encode())
+        hasher.update(mask.tobytes())
+    hasher.update(repr(b0_threshold).encode())
+    return hasher.hexdigest()
+
+
 def fit_dti(data_files, bval_files, bvec_files, mask=None,
-            out_dir=None, file_prefix=None, b0_threshold=50):
+            out_dir=None, file_prefix=None, b0_threshold=50, n_jobs=1,
+            overwrite=False):
     """
     Fit the DTI model using default settings, save files with derived maps.
 
@@ -104,6 +178,16 @@ def fit_dti(data_files, bval_files, bvec_files, mask=None,
         Default: maps get stored in the same directory as the last DWI file
         in `data_files`.
     b0_threshold : float
+    n_jobs : int, optional
+        Number of processes to fit the model with. The volume is split into
+        slabs along its first axis, which are fit independently. Set to -1 to
+        use all available CPUs.
+        Default: 1
+    overwrite : bool, optional
+        If False, and the maps in `out_dir` were computed from the same
+        inputs (as recorded in a `dti_cache.json` file next to them), the
+        model is not refit and the existing files are returned.
+        Default: False
 
     Returns
     -------
@@ -115,17 +199,6 @@ def fit_dti(data_files, bval_files, bvec_files, mask=None,
     -----
     Maps that are calculated: FA, MD, AD, RD
     """
-    img, data, gtab, mask = ut.prepare_data(data_files, bval_files,
-                                            bvec_files, mask=mask,
-                                            b0_threshold=b0_threshold)
-
-    # In this case, we dump the fit object
-    dtf = _fit(gtab, data, mask=mask)
-    FA, MD, AD, RD, params = dtf.fa, dtf.md, dtf.ad, dtf.rd, dtf.model_params
-
-    maps = [FA, MD, AD, RD, params]
-    names = ['FA', 'MD', 'AD', 'RD', 'params']
-
     if out_dir is None:
         if isinstance(data_files, list):
             out_dir = op.join(op.split(data_files[0])[0], 'dti')
@@ -134,14 +207,61 @@ def fit_dti(data_files, bval_files, bvec_files, mask=None,
     if file_prefix is None:
         file_prefix = ''
 
+    names = ['FA', 'MD', 'AD', 'RD', 'params']
+    file_paths = {}
+    for n in names:
+        file_paths[n] = op.join(out_dir, file_prefix + 'dti_%s.nii.gz' % n)
+
+    cache_file = op.join(out_dir, file_prefix + 'dti_cache.json')
+    # Validate the inputs before looking for saved maps, so that inconsistent
+    # inputs raise the same error whether or not the maps exist:
+    ut.check_file_inputs(data_files, bval_files, bvec_files)
+    key = _inputs_key(data_files, bval_files, bvec_files, mask=mask,
+                      b0_threshold=b0_threshold)
+    if not overwrite and op.exists(cache_file):
+        with open(cache_file) as f:
+            cache = json.load(f)
+        if cache['key'] == key and cache['paths'] == file_paths and all(
+                op.exists(fname) for fname in file_paths.values()):
+            return file_paths
+
+    img, data, gtab, mask = ut.prepare_data(data_files, bval_files,
+                                            bvec_files, mask=mask,
+                                            b0_threshold=b0_threshold)
+
+    # In this case, we dump the fit object
+    if n_jobs == 1:
+        params = _fit(gtab, data, mask=mask).model_params
+    else:
+        params = _fit_parallel(gtab, data, mask=mask, n_jobs=n_jobs)
+
+    # The first three parameters are the eigenvalues, sorted in descending
+    # order. All of the scalar maps are derived from these in one go:
+    FA, MD, AD, RD = dti_metrics(params[..., :3])
+
+    maps = [FA, MD, AD, RD, params]
+
     if not op.exists(out_dir):
         os.makedirs(out_dir)
 
     aff = img.affine
-    file_paths = {}
-    for m, n in zip(maps, names):
-        file_paths[n] = op.join(out_dir, file_prefix + 'dti_%s.nii.gz' % n)
-        nib.save(nib.Nifti1Image(m, aff), file_paths[n])
+    # All of the maps share one header, matching the dtype of the fit, so
+    # that nibabel does not need to cast the data while saving:
+    hdr = nib.Nifti1Header()
+    hdr.set_data_dtype(params.dtype)
+
+    def _save_map(m, fname):
+        nib.Nifti1Image(
+            np.ascontiguousarray(m, dtype=params.dtype), aff,
+            header=hdr).to_filename(fname)
+
+    # Saving is dominated by gzip compression, which releases the GIL, so the
+    # maps are compressed and written concurrently:
+    with ThreadPoolExecutor(max_workers=len(maps)) as executor:
+        list(executor.map(_save_map, maps, [file_paths[n] for n in names]))
+
+    with open(cache_file, 'w') as f:
+        json.dump({'key': key, 'paths': file_paths}, f)
 
     return file_paths
 
@@ -173,17 +293,14 @@ def predict(params_file, gtab, S0_file=None, out_dir=None):
         out_dir = op.join(op.split(params_file)[0])
 
     if S0_file is None:
+        # A scalar S0 is broadcast by dipy against the predicted signal, so
+        # no full volume of S0 values is ever allocated:
         S0 = 100
     else:
-        S0 = nib.load(S0_file).get_fdata()
-        # If the S0 data is 4D, we assume it comes from an acquisition that had
-        # B0 measurements in the same volumes described in the gtab:
-        if len(S0.shape) == 4:
-            S0 = np.mean(S0[..., gtab.b0s_mask], -1)
-        # Otherwise, we assume that it's already a 3D volume, and do nothing
+        S0 = ut.read_S0(S0_file, gtab)
 
     img = nib.load(params_file)
-    params = img.get_fdata()
+    params = np.asanyarray(img.dataobj)
     pred = dti.tensor_prediction(params, gtab, S0=S0)
     fname = op.join(out_dir, 'dti_prediction.nii.gz')
     nib.save(nib.Nifti1Image(pred, img.affine), fname)
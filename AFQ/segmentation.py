@@ -19,7 +19,6 @@ from dipy.io.stateful_tractogram import StatefulTractogram, Space
 from dipy.io.streamline import save_tractogram
 
 import AFQ.registration as reg
-import AFQ.utils.models as ut
 import AFQ.utils.volume as auv
 import AFQ.data.fetch as afd
 from AFQ.data.utils import BUNDLE_RECO_2_AFQ
@@ -327,6 +326,7 @@ class Segmentation:
         self.logger.info("Preparing Segmentation Parameters")
         self.img_affine = img_affine
         self.prepare_img(fdata, fbval, fbvec)
+        self.inv_img_affine = np.linalg.inv(self.img_affine)
         self.logger.info("Preprocessing Streamlines")
         tg = self._read_tg(tg)
 
@@ -363,9 +363,8 @@ class Segmentation:
             Full path to data, bvals, bvecs
         """
         if self.img_affine is None:
-            self.img, _, _, _ = \
-                ut.prepare_data(fdata, fbval, fbvec,
-                                b0_threshold=self.b0_threshold)
+            # Only the header is needed here, so the data is not loaded:
+            self.img = nib.load(fdata)
             self.img_affine = self.img.affine
 
         self.fdata = fdata
@@ -406,11 +405,7 @@ class Segmentation:
             if reg_prealign is None:
                 reg_prealign = np.eye(4)
             if self.img is None:
-                self.img, _, _, _ = \
-                    ut.prepare_data(self.fdata,
-                                    self.fbval,
-                                    self.fbvec,
-                                    b0_threshold=self.b0_threshold)
+                self.img = nib.load(self.fdata)
             self.mapping = reg.read_mapping(
                 mapping,
                 self.img,
@@ -434,13 +429,12 @@ class Segmentation:
         if tg is None:
             tg = self.tg
         if template is None:
-            template_affine = self.img_affine
+            inv_template_affine = self.inv_img_affine
         else:
-            template_affine = template.affine
+            inv_template_affine = np.linalg.inv(template.affine)
 
         # What is the x,y,z coordinate of 0,0,0 in the template space?
-        zero_coord = np.dot(np.linalg.inv(template_affine),
-                            np.array([0, 0, 0, 1]))
+        zero_coord = np.dot(inv_template_affine, np.array([0, 0, 0, 1]))
 
         self.crosses = np.zeros(len(tg), dtype=bool)
         # already_split = 0
@@ -501,7 +495,7 @@ class Segmentation:
                     if isinstance(roi, str):
                         roi = nib.load(roi)
                     if isinstance(roi, nib.Nifti1Image):
-                        roi = roi.get_fdata()
+                        roi = np.asanyarray(roi.dataobj, dtype=np.float32)
                     warped_roi = roi
 
                 if roi_type == 'include':
@@ -534,7 +528,7 @@ class Segmentation:
             'prob_map', np.ones(roi.shape))
 
         if not isinstance(prob_map, np.ndarray):
-            prob_map = prob_map.get_fdata()
+            prob_map = np.asanyarray(prob_map.dataobj, dtype=np.float32)
         if "space" in bundle_entry\
                 and bundle_entry["space"] == "subject":
             warped_prob_map = prob_map.copy()
@@ -739,7 +733,8 @@ class Segmentation:
                                     or self.bundle_dict[bundle][
                                         "space"] == "template":
                                 warped_roi = self.mapping.transform_inverse(
-                                    warped_roi.get_fdata(),
+                                    np.asanyarray(
+                                        warped_roi.dataobj, dtype=np.float32),
                                     interpolation='nearest')
 
                                 if self.save_intermediates is not None:
@@ -758,7 +753,8 @@ class Segmentation:
                                             bundle,
                                             f'{end_type}point_as_used.nii.gz'))
                             else:
-                                warped_roi = warped_roi.get_fdata()
+                                warped_roi = np.asanyarray(
+                                    warped_roi.dataobj, dtype=np.float32)
                             atlas_idx.append(
                                 np.array(np.where(warped_roi > 0)).T)
                         else:
@@ -3,6 +3,9 @@ import numpy as np
 import numpy.testing as npt
 import pytest
 
+import nibabel as nib
+import nibabel.tmpdirs as nbtmp
+
 from bids.layout import BIDSLayout
 
 import AFQ.definitions.image as afm
@@ -48,6 +51,49 @@ def test_resample_image():
         image_data.dtype)
 
 
+class _IdentityMap:
+    def transform_inverse(self, data, **kwargs):
+        return np.asarray(data, dtype=float)
+
+
+def test_roi_image_fa_threshold():
+    shape = (6, 7, 8)
+    rois = np.zeros((3,) + shape, dtype=bool)
+    rois[0, 1:3, 1:3, 1:3] = True
+    rois[1, 2:5, 3:6, 4:7] = True
+    rois[2, 4:6, 0:2, 0:3] = True
+    fa = np.random.rand(*shape)
+    fa_thresh = 0.4
+    roi_imgs = [
+        nib.Nifti1Image(roi.astype(np.float32), np.eye(4)) for roi in rois]
+    bundle_dict = {
+        "bundle_a": {"include": roi_imgs[:2]},
+        "bundle_b": {"include": roi_imgs[2:]}}
+
+    with nbtmp.InTemporaryDirectory() as tmpdir:
+        fa_file = op.join(tmpdir, "fa.nii.gz")
+        nib.save(nib.Nifti1Image(fa, np.eye(4)), fa_file)
+        data_imap = {"bundle_dict": bundle_dict, "dti_fa": fa_file}
+
+        image_getter = RoiImage(
+            fa_threshold=fa_thresh).get_image_getter("mapping")
+        roi_img, _ = image_getter(np.eye(4), _IdentityMap(), data_imap, {})
+        npt.assert_array_equal(
+            roi_img.get_fdata().astype(bool),
+            np.any(rois, 0) & (nib.load(fa_file).get_fdata() >= fa_thresh))
+
+        # Without a threshold, the ROIs are just or'd together:
+        image_getter = RoiImage().get_image_getter("mapping")
+        roi_img, _ = image_getter(np.eye(4), _IdentityMap(), data_imap, {})
+        npt.assert_array_equal(
+            roi_img.get_fdata().astype(bool), np.any(rois, 0))
+
+    # Bundles without any ROIs cannot make an image:
+    with pytest.raises(ValueError):
+        image_getter(
+            np.eye(4), _IdentityMap(), {"bundle_dict": {"x": {}}}, {})
+
+
 @pytest.mark.parametrize("subject", ["01", "02"])
 @pytest.mark.parametrize("session", ["01", "02"])
 def test_find_path(subject, session):
@@ -1,5 +1,8 @@
+import os
 import os.path as op
 
+import pytest
+
 import numpy as np
 import numpy.testing as npt
 
@@ -10,10 +13,12 @@ from dipy.core.geometry import vector_norm
 import dipy.core.gradients as dpg
 import dipy.data as dpd
 from dipy.io.gradients import read_bvals_bvecs
+import dipy.reconst.dti as dpy_dti
 
 import AFQ.utils.models as ut
 from AFQ.models import dti
 from AFQ._fixes import in_place_norm
+import AFQ._dti_kernels as adk
 from AFQ.utils.testing import make_dti_data
 
 
@@ -40,6 +45,7 @@ def test_noise_from_b0():
         noise = dti.noise_from_b0(data, gtab, bvals, mask=mask)
         npt.assert_almost_equal(noise, 0)
 
+
 def test_fit_dti():
     # Let's see whether we can pass a list of files for each one:
     fdata1, fbval1, fbvec1 = dpd.get_fnames('small_101D')
@@ -52,6 +58,107 @@ def test_fit_dti():
                                 out_dir=tmpdir)
         for f in file_dict.values():
             npt.assert_(op.exists(f))
+            # Display settings of the DWI should not carry over to the maps:
+            hdr = nib.load(f).header
+            npt.assert_equal(hdr['cal_min'], 0)
+            npt.assert_equal(hdr['cal_max'], 0)
+            npt.assert_equal(hdr['descrip'].item(), b'')
+            npt.assert_equal(hdr['intent_code'], 0)
+            npt.assert_equal(hdr['dim_info'], 0)
+            npt.assert_equal(hdr['toffset'], 0)
+
+        # With unchanged inputs, the saved maps are reused:
+        mtimes = [os.stat(f).st_mtime_ns for f in file_dict.values()]
+        npt.assert_equal(
+            dti.fit_dti([fdata1, fdata2],
+                        [fbval1, fbval2],
+                        [fbvec1, fbvec2],
+                        out_dir=tmpdir),
+            file_dict)
+        npt.assert_equal(
+            [os.stat(f).st_mtime_ns for f in file_dict.values()], mtimes)
+
+        # Inconsistent inputs still raise, even if the maps are saved:
+        with pytest.raises(ValueError):
+            dti.fit_dti(fdata1, [fbval1], fbvec1, out_dir=tmpdir)
+
+        # Fitting in parallel slabs should give the same parameters:
+        par_dir = op.join(tmpdir, 'parallel')
+        par_file_dict = dti.fit_dti([fdata1, fdata2],
+                                    [fbval1, fbval2],
+                                    [fbvec1, fbvec2],
+                                    out_dir=par_dir,
+                                    n_jobs=2)
+        for k in file_dict:
+            npt.assert_almost_equal(
+                nib.load(par_file_dict[k]).get_fdata(),
+                nib.load(file_dict[k]).get_fdata())
+
+
+@pytest.mark.parametrize("use_numba", [False, True])
+def test_dti_metrics(use_numba, monkeypatch):
+    if use_numba and not adk.has_numba:
+        pytest.skip("numba is not installed")
+    monkeypatch.setattr(adk, "has_numba", use_numba)
+    evals = np.random.rand(4, 5, 6, 3)
+    evals = -np.sort(-evals, axis=-1)
+    # Voxels outside of the mask have all-zero eigenvalues:
+    evals[0, 0, 0] = 0
+    # Failed fits should propagate NaN, as in dipy:
+    evals[1, 1, 1] = np.nan
+    FA, MD, AD, RD = adk.dti_metrics(evals)
+    npt.assert_almost_equal(FA, dpy_dti.fractional_anisotropy(evals))
+    npt.assert_almost_equal(MD, dpy_dti.mean_diffusivity(evals))
+    npt.assert_almost_equal(AD, dpy_dti.axial_diffusivity(evals))
+    npt.assert_almost_equal(RD, dpy_dti.radial_diffusivity(evals))
+
+
+@pytest.mark.parametrize("use_numba", [False, True])
+def test_make_seed_roi(use_numba, monkeypatch):
+    if use_numba and not adk.has_numba:
+        pytest.skip("numba is not installed")
+    monkeypatch.setattr(adk, "has_numba", use_numba)
+    rois = np.random.rand(3, 4, 5, 6) > 0.7
+    fa = np.random.rand(4, 5, 6)
+    npt.assert_array_equal(
+        adk.make_seed_roi(rois, fa, 0.6),
+        np.logical_and(np.any(rois, axis=0), fa >= 0.6))
+    # An integer threshold and float32 FA are also supported:
+    fa32 = fa.astype(np.float32)
+    npt.assert_array_equal(
+        adk.make_seed_roi(rois, fa32, 0),
+        np.any(rois, axis=0))
+
+
+def test_warmup():
+    adk.warmup()
+
+
+def test_read_S0():
+    # b0s spread through the acquisition, not just at the start:
+    bvals = np.full(10, 1000.)
+    bvals[[0, 4, 7]] = 0
+    bvecs = np.random.randn(10, 3)
+    bvecs[bvals == 0] = 0
+    gtab = dpg.gradient_table(bvals, bvecs)
+    data = np.random.randint(0, 1000, (4, 5, 6, 10)).astype(np.int16)
+    with nbtmp.InTemporaryDirectory() as tmpdir:
+        fdata = op.join(tmpdir, 'dwi.nii.gz')
+        nib.save(nib.Nifti1Image(data, np.eye(4)), fdata)
+        npt.assert_almost_equal(
+            ut.read_S0(fdata, gtab),
+            np.mean(data[..., gtab.b0s_mask], -1))
+
+        # A 3D S0 is used as is:
+        fS0 = op.join(tmpdir, 'S0.nii.gz')
+        nib.save(nib.Nifti1Image(data[..., 0], np.eye(4)), fS0)
+        npt.assert_almost_equal(ut.read_S0(fS0, gtab), data[..., 0])
+
+        # Without any b0s in the gtab, there is nothing to average:
+        no_b0_gtab = dpg.gradient_table(
+            np.full(10, 1000.), np.random.randn(10, 3))
+        with pytest.raises(ValueError):
+            ut.read_S0(fdata, no_b0_gtab)
 
 
 def test_predict_dti():
@@ -60,7 +60,7 @@ def test_segment():
     npt.assert_(len(CST_R_sl) > 0)
     # Calculate the tract profile for a volume of all-ones:
     tract_profile = afq_profile(
-        np.ones(nib.load(hardi_fdata).shape[:3]),
+        np.ones(hardi_img.shape[:3]),
         CST_R_sl.streamlines, np.eye(4))
     npt.assert_almost_equal(tract_profile, np.ones(100))
 
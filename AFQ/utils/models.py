@@ -1,8 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import nibabel as nib
 import dipy.core.gradients as dpg
 
 
+def check_file_inputs(data_files, bval_files, bvec_files):
+    """
+    Check that the DWI file inputs are consistently either all strings with
+    one full path, or all lists of full paths.
+
+    Returns
+    -------
+    is_str : bool
+        Whether the inputs are strings.
+    """
+    is_str = isinstance(data_files, str)
+    if is_str != isinstance(bval_files, str) or \
+            is_str != isinstance(bvec_files, str):
+        e_s = "Please provide consistent inputs to `prepare_data`. All file"
+        e_s += " inputs should be either lists of full paths, or a string"
+        e_s += " with one full path."
+        raise ValueError(e_s)
+    return is_str
+
+
 def prepare_data(data_files, bval_files, bvec_files, mask=None,
                  b0_threshold=50):
     """
@@ -24,32 +46,77 @@ def prepare_data(data_files, bval_files, bvec_files, mask=None,
     gtab : GradientTable
     mask : ndarray
     """
-    types = [type(f) for f in [data_files, bval_files, bvec_files]]
-    if len(set(types)) > 1:
-        e_s = "Please provide consistent inputs to `prepare_data`. All file"
-        e_s += " inputs should be either lists of full paths, or a string"
-        e_s += " with one full path."
-        raise ValueError(e_s)
+    is_str = check_file_inputs(data_files, bval_files, bvec_files)
 
-    if isinstance(data_files, str):
+    if is_str:
         data_files = [data_files]
         bval_files = [bval_files]
         bvec_files = [bvec_files]
 
     # Load the mask if it is a string
     if isinstance(mask, str):
-        mask = nib.load(mask).get_fdata().astype(bool)
+        mask = np.asanyarray(nib.load(mask).dataobj).astype(bool)
 
+    # Read the headers first, so that the outputs can be allocated once and
+    # filled in place, instead of concatenating lists of arrays:
     img_array = [nib.load(dfile) for dfile in data_files]
-    data_array = [img.get_fdata() for img in img_array]
-    data = np.concatenate(data_array, -1)
+    n_vols = [img.shape[-1] for img in img_array]
+    vol_starts = np.cumsum([0] + n_vols[:-1])
+    data = np.empty(img_array[0].shape[:-1] + (sum(n_vols),))
+    bvals = np.empty(sum(n_vols))
+    bvecs = np.empty((3, sum(n_vols)))
 
-    bvals_array = [np.loadtxt(bval_file) for bval_file in bval_files]
-    bvals = np.concatenate(bvals_array)
+    def _read_run(img, bval_file, bvec_file, vol_start, n_vol):
+        vols = slice(vol_start, vol_start + n_vol)
+        data[..., vols] = np.asanyarray(img.dataobj)
+        bvals[vols] = np.loadtxt(bval_file)
+        run_bvecs = np.loadtxt(bvec_file)
+        # bvecs may be stored either as 3 rows or as 3 columns:
+        if run_bvecs.shape[0] != 3:
+            run_bvecs = run_bvecs.T
+        bvecs[:, vols] = run_bvecs
 
-    bvecs_array = [np.loadtxt(bvec_file) for bvec_file in bvec_files]
-    bvecs = np.concatenate(bvecs_array, -1)
+    # Reading is dominated by decompression, which releases the GIL, so
+    # multiple runs are read concurrently, each straight into its own slab:
+    with ThreadPoolExecutor(max_workers=len(data_files)) as executor:
+        # Consume the results, so that errors in the workers are raised:
+        list(executor.map(
+            _read_run, img_array, bval_files, bvec_files,
+            vol_starts, n_vols))
 
     gtab = dpg.gradient_table(bvals, bvecs, b0_threshold=b0_threshold)
 
     return img_array[-1], data, gtab, mask
+
+
+def read_S0(S0_file, gtab):
+    """
+    Read S0 measurements from a nifti file, for use in signal predictions.
+
+    Parameters
+    ----------
+    S0_file : str
+        Full path to a nifti file that contains S0 measurements. If the file
+        contains 4D data, the volumes that contain the S0 data must be the
+        same as the gtab.b0s_mask, and their mean is returned.
+    gtab : GradientTable
+
+    Returns
+    -------
+    S0 : 3D ndarray
+    """
+    S0_img = nib.load(S0_file)
+    # If the S0 data is 4D, we assume it comes from an acquisition that had
+    # B0 measurements in the same volumes described in the gtab:
+    if len(S0_img.shape) == 4:
+        b0_idx = np.where(gtab.b0s_mask)[0]
+        if len(b0_idx) == 0:
+            raise ValueError((
+                f"The 4D S0 file {S0_file} has no b0 volumes, according "
+                "to the b0s_mask of the gtab."))
+        # The span holding all of the b0s is read at once, because reading
+        # volumes one by one restarts decompression of gzipped files:
+        b0_span = S0_img.dataobj[..., b0_idx[0]:b0_idx[-1] + 1]
+        return np.mean(b0_span[..., b0_idx - b0_idx[0]], -1)
+    # Otherwise, we assume that it's already a 3D volume, and do nothing
+    return S0_img.get_fdata()
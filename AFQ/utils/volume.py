@@ -40,7 +40,8 @@ def transform_inverse_roi(roi, mapping, bundle_name="ROI"):
     if isinstance(roi, str):
         roi = nib.load(roi)
     if isinstance(roi, nib.Nifti1Image):
-        roi = roi.get_fdata()
+        # dipy warps in float32, so read the ROI directly as float32:
+        roi = np.asanyarray(roi.dataobj, dtype=np.float32)
 
     _roi = mapping.transform_inverse(roi, interpolation='linear')
 